@@ -1,11 +1,85 @@
 import streamlit as st
 import geopandas as gpd
 import pandas as pd
+import numpy as np
 import folium
 from folium.features import GeoJsonTooltip
-from streamlit_folium import folium_static
+import pydeck as pdk
 import tempfile
 import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Read shapefiles through pyogrio's vectorized Arrow path instead of Fiona
+gpd.options.io_engine = "pyogrio"
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Recommendation thresholds, lowest bin first. Bins are right-closed, so a
+# value lands in the bin whose upper edge it does not exceed.
+URBAN_BINS = [-np.inf, 11, 18.7, 24.6, 30.5, 36.4, 42.3, 48.2, 54.1, 60, np.inf]
+URBAN_LABELS = [
+    "Promote urban development in underdeveloped areas",
+    "Encourage planned urban growth and reduce informal settlements",
+    "Improve basic infrastructure and access to essential services",
+    "Develop sustainable industrial zones and manage urban sprawl",
+    "Support community-driven urban projects and housing affordability",
+    "Promote green building practices and energy-efficient policies",
+    "Strengthen public transport systems and pedestrian-friendly spaces",
+    "Encourage eco-friendly transportation and smart city initiatives",
+    "Enhance infrastructure resilience and promote mixed-use development",
+    "Focus on sustainable urbanization in high urban density areas",
+]
+
+INFRASTRUCTURE_BINS = [-np.inf, 2000, 4000, 6000, 8000, 10000, np.inf]
+INFRASTRUCTURE_LABELS = [
+    "Prioritize infrastructure development in regions with limited agricultural land",
+    "Optimize infrastructure for better utilization in moderately agricultural areas",
+    "Focus on enhancing infrastructure to support medium-scale agricultural activities",
+    "Promote balanced infrastructure development to complement agricultural production",
+    "Encourage large-scale infrastructure expansion to support agriculture and rural growth",
+    "Expand infrastructure projects significantly in states with highly extensive agricultural land",
+]
+
+ENVIRONMENT_BINS = [-np.inf, 500, 1000, 1500, 2000, 2500, 3000, 3500, 4000, 4500, 5000, np.inf]
+ENVIRONMENT_LABELS = [
+    "Initiate basic conservation and afforestation efforts in critical regions",
+    "Promote small-scale afforestation and awareness programs",
+    "Encourage community involvement and local conservation initiatives",
+    "Focus on targeted afforestation efforts in underutilized regions",
+    "Support moderate-scale afforestation projects and community participation",
+    "Promote sustainable forestry and eco-friendly policies in high-impact areas",
+    "Increase funding for conservation programs and biodiversity initiatives",
+    "Enhance forest management practices and sustainable land use strategies",
+    "Strengthen community-driven conservation efforts and reforestation plans",
+    "Focus on large-scale afforestation and forest preservation projects",
+    "Implement extensive reforestation and conservation programs to preserve ecosystems",
+]
+
+SOCIO_ECONOMIC_BINS = [-np.inf, 60, 120, 180, 240, 300, 360, 420, 480, 540, 600, 660, 720, 780, np.inf]
+SOCIO_ECONOMIC_LABELS = [
+    "Focus on rural development and connectivity in sparsely populated areas",
+    "Support sparsely populated regions with roadways and basic facilities",
+    "Enhance rural infrastructure and agricultural support",
+    "Improve access to education and healthcare in moderately populated areas",
+    "Invest in medium-density regions with industrial hubs",
+    "Promote urbanization in emerging towns and cities",
+    "Develop infrastructure and job opportunities in densely populated regions",
+    "Implement smart city projects for high-density urban areas",
+    "Enhance public transportation and housing in urban centers",
+    "Expand utilities and green spaces in highly urbanized areas",
+    "Focus on reducing congestion and pollution in urban hotspots",
+    "Prioritize high-density urban centers with smart city initiatives",
+    "Develop advanced infrastructure for mega-cities and metropolitan regions",
+    "Address overpopulation challenges with sustainable city planning",
+]
+
+def strip_to_numeric(series, char):
+    # Strip formatting characters in one numpy pass; unparseable cells become 0
+    values = np.char.replace(series.to_numpy(dtype=object).astype(str), char, '')
+    return pd.Series(pd.to_numeric(values, errors='coerce'), index=series.index).fillna(0.0)
 
 def upload_files():
     st.title("Upload Geospatial Data Files")
@@ -25,104 +99,175 @@ def save_uploaded_files(uploaded_files):
 
     for file in uploaded_files:
         file_path = os.path.join(temp_dir.name, file.name)
-        file_paths[file.name.split('.')[-1]] = file_path
-        with open(file_path, 'wb') as f:
-            f.write(file.getvalue())
+        ext = os.path.splitext(file.name)[1][1:].lower()
+        if ext in file_paths:
+            raise ValueError(f"Multiple .{ext} files uploaded; upload one of each shapefile component")
+        file_paths[ext] = file_path
+        # Stream in 1 MiB chunks rather than materializing the whole upload
+        file.seek(0)
+        with open(file_path, 'wb', buffering=COPY_BUFFER_SIZE) as f:
+            shutil.copyfileobj(file, f, length=COPY_BUFFER_SIZE)
 
     return file_paths, temp_dir
 
 def process_files(shapefile_paths, population_file, land_file):
-    gdf = gpd.read_file(shapefile_paths['shp'])
-    population_data = pd.read_csv(population_file, encoding='latin1')
-    land_data = pd.read_csv(land_file)
+    gdf = gpd.read_file(shapefile_paths['shp'], engine="pyogrio", use_arrow=True)
+    # Only parse the columns that are merged or scored below
+    population_data = pd.read_csv(
+        population_file, engine="pyarrow", encoding='latin1',
+        usecols=['State orÿUnion Territory', 'Urban pop. In %', 'Density'],
+        dtype={'Urban pop. In %': 'string', 'Density': 'string'}
+    )
+    land_data = pd.read_csv(
+        land_file, engine="pyarrow",
+        usecols=['States/UTs', 'Net area sown', 'Forests']
+    )
+
+    # Merge datasets: both tables are keyed one row per state, so align them
+    # to the shapefile's rows and attach them in a single join. Aligning first
+    # keeps unmatched CSV rows (e.g. the India total) from adding NaN rows that
+    # would upcast the shapefile's own columns
+    states = gdf['statename']
+    gdf = gdf.join([
+        population_data.set_index('State orÿUnion Territory').reindex(states).set_axis(gdf.index),
+        land_data.set_index('States/UTs').reindex(states).set_axis(gdf.index),
+    ], how='left')
 
-    # Merge datasets
-    gdf = gdf.merge(population_data, left_on='statename', right_on='State orÿUnion Territory', how='left')
-    gdf = gdf.merge(land_data, left_on='statename', right_on='States/UTs', how='left')
+    # Web maps expect WGS84 lon/lat; reprojecting first also makes the
+    # simplify tolerance below mean degrees whatever the source CRS
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(4326)
+
+    # Full-resolution state boundaries are far more detail than the web map needs
+    gdf['geometry'] = gdf.geometry.simplify(0.01, preserve_topology=True)
 
     # Convert columns to numeric, handling potential string formatting issues
-    gdf['Urban Planning'] = gdf['Urban pop. In %'].str.replace('%', '', regex=False).astype(float).fillna(0)
+    gdf['Urban Planning'] = strip_to_numeric(gdf['Urban pop. In %'], '%')
     gdf['Infrastructure Development'] = gdf['Net area sown'].astype(float).fillna(0)
     gdf['Environmental Conservation'] = gdf['Forests'].astype(float).fillna(0)
     
     # Fix: Remove commas before converting Density to float
-    gdf['Socio-Economics Analysis'] = gdf['Density'].str.replace(',', '', regex=True).astype(float).fillna(0)
-
-    # Assign recommendations based on data
-    gdf['Urban Planning Recommendation'] = gdf['Urban Planning'].apply(
-        lambda x: "Focus on sustainable urbanization in high urban density areas" if x > 60
-        else "Enhance infrastructure resilience and promote mixed-use development" if x > 54.1
-        else "Encourage eco-friendly transportation and smart city initiatives" if x > 48.2
-        else "Strengthen public transport systems and pedestrian-friendly spaces" if x > 42.3
-        else "Promote green building practices and energy-efficient policies" if x > 36.4
-        else "Support community-driven urban projects and housing affordability" if x > 30.5
-        else "Develop sustainable industrial zones and manage urban sprawl" if x > 24.6
-        else "Improve basic infrastructure and access to essential services" if x > 18.7
-        else "Encourage planned urban growth and reduce informal settlements" if x > 11
-        else "Promote urban development in underdeveloped areas"
-    )
+    gdf['Socio-Economics Analysis'] = strip_to_numeric(gdf['Density'], ',')
 
-    gdf['Infrastructure Development Recommendation'] = gdf['Infrastructure Development'].apply(
-        lambda x: (
-        "Expand infrastructure projects significantly in states with highly extensive agricultural land" if x > 10000
-        else "Encourage large-scale infrastructure expansion to support agriculture and rural growth" if x > 8000
-        else "Promote balanced infrastructure development to complement agricultural production" if x > 6000
-        else "Focus on enhancing infrastructure to support medium-scale agricultural activities" if x > 4000
-        else "Optimize infrastructure for better utilization in moderately agricultural areas" if x > 2000
-        else "Prioritize infrastructure development in regions with limited agricultural land"
-    ))
-    gdf['Environmental Conservation Recommendation'] = gdf['Environmental Conservation'].apply(
-        lambda x: (
-        "Implement extensive reforestation and conservation programs to preserve ecosystems" if x > 5000
-        else "Focus on large-scale afforestation and forest preservation projects" if x > 4500
-        else "Strengthen community-driven conservation efforts and reforestation plans" if x > 4000
-        else "Enhance forest management practices and sustainable land use strategies" if x > 3500
-        else "Increase funding for conservation programs and biodiversity initiatives" if x > 3000
-        else "Promote sustainable forestry and eco-friendly policies in high-impact areas" if x > 2500
-        else "Support moderate-scale afforestation projects and community participation" if x > 2000
-        else "Focus on targeted afforestation efforts in underutilized regions" if x > 1500
-        else "Encourage community involvement and local conservation initiatives" if x > 1000
-        else "Promote small-scale afforestation and awareness programs" if x > 500
-        else "Initiate basic conservation and afforestation efforts in critical regions"
+    # Assign recommendations based on data; pd.cut yields Categorical columns
+    gdf['Urban Planning Recommendation'] = pd.cut(
+        gdf['Urban Planning'], bins=URBAN_BINS, labels=URBAN_LABELS, right=True
+    )
+    gdf['Infrastructure Development Recommendation'] = pd.cut(
+        gdf['Infrastructure Development'], bins=INFRASTRUCTURE_BINS, labels=INFRASTRUCTURE_LABELS, right=True
     )
+    gdf['Environmental Conservation Recommendation'] = pd.cut(
+        gdf['Environmental Conservation'], bins=ENVIRONMENT_BINS, labels=ENVIRONMENT_LABELS, right=True
+    )
+    gdf['Socio-Economics Analysis Recommendation'] = pd.cut(
+        gdf['Socio-Economics Analysis'], bins=SOCIO_ECONOMIC_BINS, labels=SOCIO_ECONOMIC_LABELS, right=True
     )
-    gdf['Socio-Economics Analysis Recommendation'] = gdf['Socio-Economics Analysis'].apply(
-        lambda x: (
-        "Focus on rural development and connectivity in sparsely populated areas" if x <= 60
-        else "Support sparsely populated regions with roadways and basic facilities" if x <= 120
-        else "Enhance rural infrastructure and agricultural support" if x <= 180
-        else "Improve access to education and healthcare in moderately populated areas" if x <= 240
-        else "Invest in medium-density regions with industrial hubs" if x <= 300
-        else "Promote urbanization in emerging towns and cities" if x <= 360
-        else "Develop infrastructure and job opportunities in densely populated regions" if x <= 420
-        else "Implement smart city projects for high-density urban areas" if x <= 480
-        else "Enhance public transportation and housing in urban centers" if x <= 540
-        else "Expand utilities and green spaces in highly urbanized areas" if x <= 600
-        else "Focus on reducing congestion and pollution in urban hotspots" if x <= 660
-        else "Prioritize high-density urban centers with smart city initiatives" if x <= 720
-        else "Develop advanced infrastructure for mega-cities and metropolitan regions" if x <= 780
-        else "Address overpopulation challenges with sustainable city planning"
-    ))
     
     return gdf
 
-def create_map(gdf, title, recommendation_column):
-    m = folium.Map(location=[23.2599, 77.4126], zoom_start=5)
-    
+# Every state is drawn the same way, so share one style function across layers
+STATE_STYLE = {'fillColor': 'blue', 'fillOpacity': 0.6, 'weight': 0.5}
+
+def state_style(feature):
+    return STATE_STYLE
+
+def build_geojson(gdf):
+    # Geometry is identical for every theme, so encode it to GeoJSON only once;
+    # process_files has already reprojected it to WGS84
+    return json.loads(gdf[['statename', 'geometry']].to_json())
+
+def theme_geojson(gdf, geo_dict, recommendation_column, key=None):
+    # Attach this theme's recommendation to the shared features under `key`
+    # (the column name by default); the feature dicts are copied so the
+    # shared geometry template is never mutated
+    key = key or recommendation_column
+    features = [
+        {**feature, 'properties': {**feature['properties'], key: recommendation}}
+        for feature, recommendation in zip(geo_dict['features'], gdf[recommendation_column])
+    ]
+    return {**geo_dict, 'features': features}
+
+def create_deck(gdf, geo_dict, recommendation_column):
+    # WebGL view of one theme for on-screen display; Folium is only used for
+    # the downloadable HTML maps
+    layer = pdk.Layer(
+        'GeoJsonLayer',
+        data=theme_geojson(gdf, geo_dict, recommendation_column, key='recommendation'),
+        get_fill_color=[0, 0, 255, 153],
+        get_line_color=[0, 0, 255],
+        line_width_min_pixels=0.5,
+        pickable=True
+    )
+    return pdk.Deck(
+        layers=[layer],
+        initial_view_state=pdk.ViewState(latitude=23.2599, longitude=77.4126, zoom=4),
+        tooltip={'html': '<b>State:</b> {statename}<br/><b>Recommendation:</b> {recommendation}'}
+    )
+
+def add_theme_layer(m, gdf, geo_dict, title, recommendation_column, show=True):
     folium.GeoJson(
-        gdf,
+        data=theme_geojson(gdf, geo_dict, recommendation_column),
         name=title,
+        show=show,
         tooltip=GeoJsonTooltip(
             fields=['statename', recommendation_column], 
             aliases=['State:', 'Recommendation:'], 
             localize=True
         ),
-        style_function=lambda x: {'fillColor': 'blue', 'fillOpacity': 0.6, 'weight': 0.5}
+        style_function=state_style
     ).add_to(m)
+
+def create_map(gdf, geo_dict, title, recommendation_column):
+    m = folium.Map(location=[23.2599, 77.4126], zoom_start=5)
+    add_theme_layer(m, gdf, geo_dict, title, recommendation_column)
     
-    file_path = f"{title.replace(' ', '_')}_Interactive_Map.html"
-    m.save(file_path)
-    return m, file_path
+    html_bytes = m.get_root().render().encode("utf-8")
+    return m, html_bytes
+
+def create_combined_map(gdf, geo_dict, maps_info):
+    # One Leaflet map with a toggleable layer per theme, first theme visible
+    m = folium.Map(location=[23.2599, 77.4126], zoom_start=5)
+    for i, (theme, column) in enumerate(maps_info.items()):
+        add_theme_layer(m, gdf, geo_dict, theme, column, show=(i == 0))
+    folium.LayerControl().add_to(m)
+
+    html_bytes = m.get_root().render().encode("utf-8")
+    return m, html_bytes
+
+def uploads_key(uploaded_files):
+    # Content hash of every upload, used to tell when the parsed data is stale
+    digest = hashlib.blake2b()
+    for file in uploaded_files:
+        digest.update(file.name.encode("utf-8"))
+        with file.getbuffer() as buffer:
+            digest.update(buffer)
+    return digest.hexdigest()
+
+def _process(shapefiles, population_file, land_file):
+    shapefile_paths, temp_dir = save_uploaded_files(shapefiles)
+    try:
+        gdf = process_files(shapefile_paths, population_file, land_file)
+    finally:
+        temp_dir.cleanup()
+    return gdf, build_geojson(gdf)
+
+# Rendered maps are keyed on the uploads' content hash; the data arguments
+# are derived from it, so they are left out of the cache key
+@st.cache_data(show_spinner=False)
+def _render_theme_maps(data_key, _gdf, _geo_dict, maps_info):
+    # The theme maps are independent, so build them concurrently; only plain
+    # folium work happens in the workers, Streamlit calls stay on the caller
+    def render(theme_column):
+        _, html_bytes = create_map(_gdf, _geo_dict, *theme_column)
+        return html_bytes
+
+    with ThreadPoolExecutor(max_workers=len(maps_info)) as executor:
+        return dict(zip(maps_info, executor.map(render, maps_info.items())))
+
+@st.cache_data(show_spinner=False)
+def _render_combined_map(data_key, _gdf, _geo_dict, maps_info):
+    _, html_bytes = create_combined_map(_gdf, _geo_dict, maps_info)
+    return html_bytes
 
 def main():
     st.title("Geospatial Analysis and Recommendations")
@@ -132,8 +277,20 @@ def main():
     if shapefiles and population_file and land_file:
         st.success("Files uploaded successfully! Processing data...")
         
-        shapefile_paths, temp_dir = save_uploaded_files(shapefiles)
-        gdf = process_files(shapefile_paths, population_file, land_file)
+        # Keep the parsed data in session state so reruns reuse the same
+        # objects instead of unpickling a cached copy
+        data_key = uploads_key([*shapefiles, population_file, land_file])
+        if st.session_state.get('gdf_key') != data_key:
+            try:
+                gdf, geo_dict = _process(shapefiles, population_file, land_file)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            st.session_state['gdf'] = gdf
+            st.session_state['geo_dict'] = geo_dict
+            st.session_state['gdf_key'] = data_key
+        gdf = st.session_state['gdf']
+        geo_dict = st.session_state['geo_dict']
 
         maps_info = {
             "Urban Planning": 'Urban Planning Recommendation',
@@ -142,16 +299,25 @@ def main():
             "Socio-Economics Analysis": 'Socio-Economics Analysis Recommendation'
         }
 
-        for theme, column in maps_info.items():
-            st.subheader(theme)
-            m, file_path = create_map(gdf, theme, column)
-            folium_static(m)
+        st.subheader("Recommendations Map")
+        theme = st.selectbox("Theme", list(maps_info))
+        st.pydeck_chart(create_deck(gdf, geo_dict, maps_info[theme]))
+
+        # Folium HTML is only rendered once downloads are requested
+        if st.checkbox("Prepare interactive map downloads"):
+            st.download_button(
+                label="Download Combined Map",
+                data=_render_combined_map(data_key, gdf, geo_dict, maps_info),
+                file_name="All_Themes_Interactive_Map.html",
+                mime='text/html'
+            )
 
-            with open(file_path, "rb") as file:
+            theme_maps = _render_theme_maps(data_key, gdf, geo_dict, maps_info)
+            for theme, html_bytes in theme_maps.items():
                 st.download_button(
                     label=f"Download {theme} Map",
-                    data=file,
-                    file_name=file_path,
+                    data=html_bytes,
+                    file_name=f"{theme.replace(' ', '_')}_Interactive_Map.html",
                     mime='text/html'
                 )
 